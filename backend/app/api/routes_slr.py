@@ -1,17 +1,43 @@
 """SLR API Routes - Agentic Interface"""
-from fastapi import APIRouter, HTTPException, WebSocket, BackgroundTasks
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Optional, List, Dict
 import asyncio
+import time
 import uuid
-from ..core.agent_controller import SLRAgentController, get_agent
-from ..core.pubmed_api import fetch_pubmed_studies
-from ..core.slr_pipeline import create_screening_pipeline
+import orjson
+from ..core.agent_controller import (
+    AgentMessage,
+    SLRAgentController,
+    get_agent,
+    get_conversation_history as load_conversation_history,
+    save_agent
+)
+from ..core.pubmed_api import MAX_ESEARCH_RESULTS, fetch_pubmed_studies
+from ..core.redis_client import JOB_TTL_SECONDS, decisions_key, get_redis, job_key
+from ..core.tasks import enqueue_slr_job, progress_channel
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["SLR"])
 
+# Job states after which no further progress is published
+TERMINAL_STATES = ("COMPLETED", "FAILED")
+
+# PubMed records fetched per job unless the request says otherwise
+DEFAULT_MAX_RESULTS = 5000
+
+# Stored decision lines fetched from Redis per streamed chunk
+DECISIONS_PAGE_SIZE = 1000
+
+# Seconds a progress socket waits for an update before re-checking the job state
+PROGRESS_POLL_SECONDS = 15
+
+def get_session_id(x_session_id: Optional[str] = Header(None)) -> str:
+    """Resolve the conversation session from the X-Session-ID header"""
+    return x_session_id or uuid.uuid4().hex
+
 class ChatMessage(BaseModel):
     """User message for agentic chat"""
     content: str
@@ -23,7 +49,7 @@ class SLRJobRequest(BaseModel):
     study_type: str
     population: Optional[str] = None
     intervention: Optional[str] = None
-    max_results: Optional[int] = 5000
+    max_results: int = Field(DEFAULT_MAX_RESULTS, ge=1, le=MAX_ESEARCH_RESULTS)
 
 class SLRJobResponse(BaseModel):
     """SLR job response"""
@@ -34,36 +60,97 @@ class SLRJobResponse(BaseModel):
     included_studies: int
     excluded_studies: int
 
-@router.post("/slr/chat")
-async def chat_endpoint(message: ChatMessage) -> Dict:
+class ChatResponse(BaseModel):
+    """Agent reply for agentic chat"""
+    session_id: str
+    role: str
+    content: str
+    data: Optional[Dict] = None
+    action: Optional[str] = None
+    job_id: Optional[str] = None
+
+class JobMetrics(BaseModel):
+    """Screening accuracy metrics"""
+    precision: float
+    recall: float
+    f1: float
+    accuracy: float
+
+class SLRJobStatusResponse(BaseModel):
+    """SLR job progress"""
+    job_id: str
+    status: str
+    progress: Optional[str] = None
+    total_found: Optional[int] = None
+    processed: Optional[int] = None
+    included: Optional[int] = None
+    excluded: Optional[int] = None
+    metrics: Optional[JobMetrics] = None
+
+class SLRResultsResponse(BaseModel):
+    """SLR job results"""
+    job_id: str
+    status: str
+    total_retrieved: Optional[int] = None
+    total_included: Optional[int] = None
+    total_excluded: Optional[int] = None
+    metrics: Optional[JobMetrics] = None
+    download_urls: Dict[str, str]
+
+@router.post("/slr/chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def chat_endpoint(
+    message: ChatMessage,
+    session_id: str = Depends(get_session_id)
+) -> ChatResponse:
     """Conversational agentic interface for SLR"""
     try:
-        agent = get_agent()
+        agent = await get_agent(session_id)
         response = agent.process_user_input(message.content)
-        return {
-            "role": response.role,
-            "content": response.content,
-            "data": response.data,
-            "action": response.action,
-            "job_id": response.job_id
-        }
+        await save_agent(agent)
+        
+        # save_agent recorded the job, so the worker's updates land on an existing hash
+        if response.action == "start_job":
+            await asyncio.to_thread(
+                enqueue_slr_job,
+                response.job_id,
+                agent.criteria.disease,
+                agent.criteria.study_type,
+                DEFAULT_MAX_RESULTS
+            )
+        return ChatResponse(
+            session_id=session_id,
+            role=response.role,
+            content=response.content,
+            data=response.data,
+            action=response.action,
+            job_id=response.job_id
+        )
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/slr/start")
-async def start_slr_job(
-    request: SLRJobRequest,
-    background_tasks: BackgroundTasks
-) -> SLRJobResponse:
+@router.post("/slr/start", response_model=SLRJobResponse)
+async def start_slr_job(request: SLRJobRequest) -> SLRJobResponse:
     """Start a new SLR job"""
     try:
-        job_id = str(uuid.uuid4())[:8]
+        job_id = uuid.uuid4().hex[:12]
         logger.info(f"Starting SLR job {job_id} for {request.disease}")
         
-        # Execute async job in background
-        background_tasks.add_task(
-            execute_slr_pipeline,
+        # Record the job before dispatch so the worker's progress updates
+        # are never overwritten by the initial state
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hset(job_key(job_id), mapping={
+                "task_id": job_id,
+                "criteria": request.model_dump_json(),
+                "state": "STARTED",
+                "started": time.time()
+            })
+            pipe.expire(job_key(job_id), JOB_TTL_SECONDS)
+            await pipe.execute()
+        
+        # The broker publish is blocking I/O, so keep it off the event loop
+        await asyncio.to_thread(
+            enqueue_slr_job,
             job_id,
             request.disease,
             request.study_type,
@@ -73,7 +160,7 @@ async def start_slr_job(
         return SLRJobResponse(
             job_id=job_id,
             status="STARTED",
-            criteria=request.dict(),
+            criteria=request.model_dump(),
             total_studies=0,
             included_studies=0,
             excluded_studies=0
@@ -82,60 +169,162 @@ async def start_slr_job(
         logger.error(f"Job start error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/slr/status/{job_id}")
-async def get_job_status(job_id: str) -> Dict:
-    """Get job execution status"""
-    # In production: query job queue (Celery)
-    return {
-        "job_id": job_id,
-        "status": "PROCESSING",
-        "progress": "Screening abstracts...",
-        "total_found": 3214,
-        "processed": 2100,
-        "included": 287,
-        "excluded": 1813,
-        "metrics": {
-            "precision": 0.91,
-            "recall": 0.97,
-            "f1": 0.94,
-            "accuracy": 0.91
-        }
-    }
+async def _wait_for_disconnect(websocket: WebSocket):
+    """Return once the client goes away, discarding anything it sends"""
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+@router.websocket("/slr/ws/{job_id}")
+async def job_progress_ws(websocket: WebSocket, job_id: str):
+    """Push job progress updates as the worker publishes them
+    
+    Subscribes before reading the stored progress, so an update published
+    in between is delivered rather than lost. The socket is read alongside the
+    subscription so a client disconnect ends the handler straight away, and a
+    quiet channel triggers a job-state check every PROGRESS_POLL_SECONDS, so a
+    job that ended or expired without a final update does not hold it open.
+    """
+    pubsub = get_redis().pubsub()
+    await pubsub.subscribe(progress_channel(job_id))
+    client_gone = None
+    try:
+        job = await get_redis().hgetall(job_key(job_id))
+        if not job:
+            await websocket.close(code=4404, reason=f"Job {job_id} not found")
+            return
+        
+        await websocket.accept()
+        if job.get('progress'):
+            await websocket.send_text(job['progress'])
+        if job['state'] in TERMINAL_STATES:
+            await websocket.close()
+            return
+        
+        client_gone = asyncio.create_task(_wait_for_disconnect(websocket))
+        while True:
+            reader = asyncio.ensure_future(
+                pubsub.get_message(ignore_subscribe_messages=True, timeout=PROGRESS_POLL_SECONDS)
+            )
+            await asyncio.wait({reader, client_gone}, return_when=asyncio.FIRST_COMPLETED)
+            if client_gone.done():
+                reader.cancel()
+                logger.info(f"Progress socket for job {job_id} disconnected")
+                break
+            
+            message = reader.result()
+            if message is None:
+                state = await get_redis().hget(job_key(job_id), 'state')
+                if state is None or state in TERMINAL_STATES:
+                    await websocket.close()
+                    break
+                continue
+            
+            await websocket.send_text(message["data"])
+            if orjson.loads(message["data"]).get("stage") in ("completed", "failed"):
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        logger.info(f"Progress socket for job {job_id} disconnected")
+    finally:
+        if client_gone:
+            client_gone.cancel()
+        # Closing the pubsub drops its connection, which also ends the subscription
+        await pubsub.close()
+
+async def _load_job(job_id: str) -> tuple:
+    """Load a job record and its latest progress update"""
+    job = await get_redis().hgetall(job_key(job_id))
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    progress = orjson.loads(job['progress']) if job.get('progress') else {}
+    return job, progress
 
-@router.get("/slr/results/{job_id}")
-async def get_job_results(job_id: str) -> Dict:
+@router.get("/slr/status/{job_id}", response_model=SLRJobStatusResponse, response_model_exclude_none=True)
+async def get_job_status(job_id: str) -> SLRJobStatusResponse:
+    """Get job execution status (polling fallback for /slr/ws/{job_id})"""
+    job, progress = await _load_job(job_id)
+    return SLRJobStatusResponse(
+        job_id=job_id,
+        status=job['state'],
+        progress=progress.get('stage'),
+        total_found=progress.get('total_found'),
+        processed=progress.get('processed'),
+        included=progress.get('included'),
+        excluded=progress.get('excluded'),
+        metrics=progress.get('metrics')
+    )
+
+@router.get("/slr/results/{job_id}", response_model=SLRResultsResponse, response_model_exclude_none=True)
+async def get_job_results(job_id: str) -> SLRResultsResponse:
     """Get SLR job results"""
-    # In production: retrieve from database
-    return {
-        "job_id": job_id,
-        "status": "COMPLETED",
-        "total_retrieved": 3214,
-        "total_included": 287,
-        "total_excluded": 2927,
-        "metrics": {
-            "precision": 0.91,
-            "recall": 0.97,
-            "f1": 0.94,
-            "accuracy": 0.91
-        },
-        "download_urls": {
+    job, progress = await _load_job(job_id)
+    if job['state'] != "COMPLETED":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['state']}")
+    return SLRResultsResponse(
+        job_id=job_id,
+        status=job['state'],
+        total_retrieved=progress.get('processed'),
+        total_included=progress.get('included'),
+        total_excluded=progress.get('excluded'),
+        metrics=progress.get('metrics'),
+        download_urls={
             "screening_results": f"/api/v1/slr/download/{job_id}/screening.xlsx",
             "metrics_summary": f"/api/v1/slr/download/{job_id}/metrics.xlsx",
             "prisma_report": f"/api/v1/slr/download/{job_id}/prisma.xlsx"
         }
-    }
+    )
+
+@router.get("/slr/decisions/{job_id}")
+async def get_job_decisions(
+    job_id: str,
+    if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """Stream screening decisions as ndjson, with ETag revalidation"""
+    job, _ = await _load_job(job_id)
+    if not job.get('decisions_etag'):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['state']}")
+    
+    # Weak, since GZipMiddleware may re-encode the body and a strong tag promises identical bytes
+    etag = f'W/"{job["decisions_etag"]}"'
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    return StreamingResponse(
+        _stream_decisions(job_id),
+        media_type="application/x-ndjson",
+        headers={"ETag": etag}
+    )
 
-@router.get("/slr/conversation")
-async def get_conversation_history() -> List[Dict]:
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header (list, W/ tags or *) against an ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for candidate in if_none_match.split(",")
+    )
+
+async def _stream_decisions(job_id: str) -> AsyncIterator[str]:
+    """Yield the worker's pre-serialized ndjson lines a page at a time"""
+    start = 0
+    while lines := await get_redis().lrange(decisions_key(job_id), start, start + DECISIONS_PAGE_SIZE - 1):
+        yield "".join(lines)
+        start += len(lines)
+
+@router.get("/slr/conversation", response_model=List[AgentMessage], response_model_exclude_none=True)
+async def get_conversation_history(session_id: str = Depends(get_session_id)) -> List[Dict]:
     """Get conversation history"""
-    agent = get_agent()
-    return agent.get_conversation_history()
+    return await load_conversation_history(session_id)
 
 @router.post("/slr/reset")
-async def reset_session() -> Dict:
+async def reset_session(session_id: str = Depends(get_session_id)) -> Dict:
     """Reset conversation session"""
-    agent = get_agent()
+    agent = await get_agent(session_id)
     response = agent.reset_session()
+    await save_agent(agent)
     return {
         "status": "reset",
         "message": response.content
@@ -145,45 +334,18 @@ async def reset_session() -> Dict:
 async def explain_decision(
     study_id: str,
     decision: str,
-    layer: str
+    layer: str,
+    session_id: str = Depends(get_session_id)
 ) -> Dict:
     """Get explainability for study decision"""
-    agent = get_agent()
+    agent = await get_agent(session_id)
     explanation = agent.explain_decision(study_id, decision, layer)
     return explanation
 
-async def execute_slr_pipeline(
-    job_id: str,
-    disease: str,
-    study_type: str,
-    max_results: int
-):
-    """Background task: Execute SLR pipeline"""
-    try:
-        logger.info(f"Executing SLR pipeline for job {job_id}")
-        
-        # Step 1: Search PubMed
-        pubmed_result = await fetch_pubmed_studies(max_results=max_results)
-        studies = pubmed_result.get('studies', [])
-        logger.info(f"Retrieved {len(studies)} studies from PubMed")
-        
-        # Step 2: Screen studies
-        pipeline = create_screening_pipeline()
-        criteria = {'disease': disease, 'study_type': study_type}
-        decisions, metrics = pipeline.screen_studies(studies, criteria)
-        logger.info(f"Screening complete: {len(decisions)} included")
-        
-        # Step 3: Generate reports
-        # In production: save to S3 + database
-        logger.info(f"Job {job_id} completed successfully")
-        
-    except Exception as e:
-        logger.error(f"Pipeline execution error for job {job_id}: {str(e)}")
-
 @router.get("/slr/pubmed/search")
 async def direct_pubmed_search(
     query: Optional[str] = None,
-    max_results: Optional[int] = 100
+    max_results: int = Query(100, ge=1, le=MAX_ESEARCH_RESULTS)
 ) -> Dict:
     """Direct PubMed search endpoint"""
     try:
@@ -1,14 +1,52 @@
 """Agentic Conversational Controller for SLR Platform"""
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel
-import json
+from dataclasses import dataclass
+import orjson
+import time
+import uuid
 from enum import Enum
-from .pubmed_api import PubMedAPI
+import ahocorasick
+from .pubmed_api import PubMedAPI, get_pubmed_api
 from .config import settings
+from .redis_client import JOB_TTL_SECONDS, get_redis, job_key
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Criteria vocabulary: term -> (field, value, priority).
+# When several terms for the same field match, the highest priority wins.
+CRITERIA_TERMS = {
+    'diabetes': ('disease', 'Diabetes', 1),
+    'type 2 diabetes': ('disease', 'Type 2 Diabetes', 2),
+    'type ii diabetes': ('disease', 'Type 2 Diabetes', 2),
+    't2d': ('disease', 'Type 2 Diabetes', 2),
+    'pcos': ('disease', 'PCOS', 0),
+    'polycystic ovary syndrome': ('disease', 'PCOS', 0),
+    'clinical trial': ('study_type', 'clinical trial', 0),
+    'randomized controlled trial': ('study_type', 'randomized controlled trial', 1),
+    'randomised controlled trial': ('study_type', 'randomized controlled trial', 1),
+    'rct': ('study_type', 'randomized controlled trial', 1),
+    'adults': ('population', 'Adults', 0),
+    'older adults': ('population', 'Older adults', 1),
+    'elderly': ('population', 'Older adults', 1),
+    'children': ('population', 'Children', 0),
+    'pediatric': ('population', 'Children', 0),
+}
+
+def _build_criteria_automaton() -> ahocorasick.Automaton:
+    """Compile the criteria vocabulary into a single Aho-Corasick automaton"""
+    automaton = ahocorasick.Automaton()
+    for term, entry in CRITERIA_TERMS.items():
+        automaton.add_word(term, entry)
+    automaton.make_automaton()
+    return automaton
+
+_criteria_automaton = _build_criteria_automaton()
+
+# Session state lives in Redis so any API worker can serve any session
+SESSION_TTL_SECONDS = 24 * 60 * 60
+
 class ConversationState(str, Enum):
     """Agent conversation states"""
     IDLE = "idle"
@@ -31,7 +69,16 @@ class SLRCriteria(BaseModel):
     custom_query: Optional[str] = None
 
 class AgentMessage(BaseModel):
-    """Agentic UI Message"""
+    """Agentic UI Message (API schema)"""
+    role: str  # user|assistant|system
+    content: str
+    data: Optional[Dict] = None
+    action: Optional[str] = None
+    job_id: Optional[str] = None
+
+@dataclass(slots=True)
+class ConversationMessage:
+    """Internal conversation message - built from trusted fields, so no validation"""
     role: str  # user|assistant|system
     content: str
     data: Optional[Dict] = None
@@ -54,28 +101,45 @@ class SLRAgentController:
     - Semantic reasoning over papers
     """
     
-    def __init__(self):
+    def __init__(self, session_id: str):
+        self.session_id = session_id
         self.state = ConversationState.IDLE
         self.criteria = SLRCriteria()
-        self.pubmed_api = PubMedAPI()
-        self.conversation_history: List[AgentMessage] = []
         self.current_job_id = None
+        
+        # Messages created this turn, appended to the Redis history on save
+        self.unsaved_messages: List[ConversationMessage] = []
+        self.history_cleared = False
+        self.job_started = False
+        
+        # Current job's Redis record, loaded by get_agent
+        self.job: Dict[str, str] = {}
+        
+        # State -> handler dispatch table
+        self._handlers = {
+            ConversationState.IDLE: self._handle_initial_input,
+            ConversationState.CRITERIA_INTAKE: self._handle_criteria_input,
+            ConversationState.EXECUTING: self._handle_status_query,
+        }
     
-    def process_user_input(self, user_input: str) -> AgentMessage:
+    @property
+    def pubmed_api(self) -> PubMedAPI:
+        """Shared PubMed client, resolved only when the agent needs it"""
+        return get_pubmed_api()
+    
+    def process_user_input(self, user_input: str) -> ConversationMessage:
         """Process user input and route to appropriate handler"""
         logger.info(f"Processing user input: {user_input[:100]}...")
         
         # Route based on state
-        if self.state == ConversationState.IDLE:
-            return self._handle_initial_input(user_input)
-        elif self.state == ConversationState.CRITERIA_INTAKE:
-            return self._handle_criteria_input(user_input)
-        elif self.state == ConversationState.EXECUTING:
-            return self._handle_status_query(user_input)
-        else:
-            return self._create_message("assistant", "Session in unexpected state. Please restart.")
+        handler = self._handlers.get(self.state, self._handle_unexpected_state)
+        return handler(user_input)
     
-    def _handle_initial_input(self, user_input: str) -> AgentMessage:
+    def _handle_unexpected_state(self, user_input: str) -> ConversationMessage:
+        """Fallback for states without a handler"""
+        return self._create_message("assistant", "Session in unexpected state. Please restart.")
+    
+    def _handle_initial_input(self, user_input: str) -> ConversationMessage:
         """Initial interaction - move to criteria intake"""
         self.state = ConversationState.CRITERIA_INTAKE
         
@@ -87,18 +151,13 @@ class SLRAgentController:
             response = user_input
             return self._handle_criteria_input(response)
     
-    def _handle_criteria_input(self, user_input: str) -> AgentMessage:
+    def _handle_criteria_input(self, user_input: str) -> ConversationMessage:
         """Parse and validate SLR criteria"""
         logger.info("Extracting criteria from user input")
         
-        # Simple parsing logic - can be enhanced with NLP
         lower_input = user_input.lower()
-        
-        # Extract disease
-        if 'diabetes' in lower_input or 't2d' in lower_input:
-            self.criteria.disease = 'Type 2 Diabetes' if 'type 2' in lower_input else 'Diabetes'
-        elif 'pcos' in lower_input:
-            self.criteria.disease = 'PCOS'
+        had_study_type = self.criteria.study_type is not None
+        self._extract_criteria(lower_input)
         
         # Check completeness
         if not self.criteria.disease:
@@ -107,8 +166,9 @@ class SLRAgentController:
                 "I understand you want to search for Type 2 Diabetes studies. \n\nPlease specify:\n2. Study Type (e.g., 'randomized controlled trial', 'clinical trial')"
             )
         
-        if not self.criteria.study_type:
-            self.criteria.study_type = 'randomized controlled trial'
+        if not had_study_type:
+            if not self.criteria.study_type:
+                self.criteria.study_type = 'randomized controlled trial'
             return self._create_message(
                 "assistant",
                 f"Using study type: {self.criteria.study_type}\n\nReady to start SLR for {self.criteria.disease}? Reply 'yes' to begin."
@@ -120,13 +180,23 @@ class SLRAgentController:
         
         return self._create_message("assistant", "Please confirm to proceed with SLR job.")
     
-    def start_slr_job(self) -> AgentMessage:
+    def _extract_criteria(self, lower_input: str):
+        """Set criteria fields from vocabulary hits in a single pass over the input"""
+        matches: Dict[str, tuple] = {}
+        for _, (field, value, priority) in _criteria_automaton.iter(lower_input):
+            if field not in matches or priority > matches[field][1]:
+                matches[field] = (value, priority)
+        
+        for field, (value, _) in matches.items():
+            setattr(self.criteria, field, value)
+    
+    def start_slr_job(self) -> ConversationMessage:
         """Trigger async SLR job"""
         logger.info(f"Starting SLR job with criteria: {self.criteria}")
         self.state = ConversationState.EXECUTING
         
-        # Generate job ID (in production: use UUID + Celery)
-        self.current_job_id = f"slr_{hash(str(self.criteria)) % 10000}"
+        self.current_job_id = uuid.uuid4().hex[:12]
+        self.job_started = True
         
         response = f"""SLR Job initiated successfully!
         
@@ -151,31 +221,39 @@ Check status anytime with: 'status'"""
         return self._create_message(
             "assistant",
             response,
-            data={"criteria": self.criteria.dict(), "job_id": self.current_job_id},
+            data={"criteria": self.criteria.model_dump(), "job_id": self.current_job_id},
             action="start_job"
         )
     
-    def _handle_status_query(self, user_input: str) -> AgentMessage:
-        """Handle job status queries"""
-        if 'status' in user_input.lower():
-            # In production: query job queue
-            return self._create_message(
-                "assistant",
-                f"""Job {self.current_job_id} Status: PROCESSING
-                
-Progress:
-- PubMed search: COMPLETE (3,214 studies found)
-- Abstract fetch: IN PROGRESS (2,100/3,214)
-- Deduplication: PENDING
-- Screening: PENDING
-- Metrics: PENDING
-
-Estimated time: 2-3 minutes"""
-            )
-        elif 'result' in user_input.lower() or 'download' in user_input.lower():
+    def _handle_status_query(self, user_input: str) -> ConversationMessage:
+        """Handle job status queries from the job's Redis record"""
+        lower_input = user_input.lower()
+        state = self.job.get('state', 'UNKNOWN')
+        progress = orjson.loads(self.job['progress']) if self.job.get('progress') else {}
+        
+        if 'status' in lower_input:
+            lines = [f"Job {self.current_job_id} Status: {state}"]
+            for label, key in (
+                ("Studies found", 'total_found'),
+                ("Retrieved", 'retrieved'),
+                ("Screened", 'processed'),
+                ("Included", 'included'),
+                ("Excluded", 'excluded'),
+            ):
+                if key in progress:
+                    lines.append(f"- {label}: {progress[key]:,}")
+            if 'error' in progress:
+                lines.append(f"- Error: {progress['error']}")
+            return self._create_message("assistant", "\n".join(lines))
+        elif 'result' in lower_input or 'download' in lower_input:
+            if state == 'COMPLETED':
+                return self._create_message(
+                    "assistant",
+                    f"Results for job {self.current_job_id} are ready: {settings.API_V1_PREFIX}/slr/results/{self.current_job_id}"
+                )
             return self._create_message(
                 "assistant",
-                f"Results not yet available. Job {self.current_job_id} still processing."
+                f"Results not yet available. Job {self.current_job_id} is {state}."
             )
         else:
             return self._create_message("assistant", "Please ask about 'status' or 'results'.")
@@ -198,33 +276,76 @@ Estimated time: 2-3 minutes"""
         content: str,
         data: Optional[Dict] = None,
         action: Optional[str] = None
-    ) -> AgentMessage:
+    ) -> ConversationMessage:
         """Create structured message"""
-        msg = AgentMessage(
+        msg = ConversationMessage(
             role=role,
             content=content,
             data=data,
             action=action,
             job_id=self.current_job_id
         )
-        self.conversation_history.append(msg)
+        self.unsaved_messages.append(msg)
         return msg
     
-    def get_conversation_history(self) -> List[Dict]:
-        """Return conversation history"""
-        return [msg.dict() for msg in self.conversation_history]
-    
-    def reset_session(self) -> AgentMessage:
+    def reset_session(self) -> ConversationMessage:
         """Reset conversation state"""
         self.state = ConversationState.IDLE
         self.criteria = SLRCriteria()
-        self.conversation_history = []
+        self.unsaved_messages = []
+        self.history_cleared = True
         self.current_job_id = None
         return self._create_message("assistant", "Session reset. Start a new SLR job with 'start'")
 
-# Singleton agent instance
-_agent = SLRAgentController()
+def _session_key(session_id: str) -> str:
+    return f"slr:sess:{session_id}"
+
+def _history_key(session_id: str) -> str:
+    return f"slr:sess:{session_id}:history"
+
+async def get_agent(session_id: str) -> SLRAgentController:
+    """Load the agent for a session from Redis"""
+    agent = SLRAgentController(session_id)
+    stored = await get_redis().hgetall(_session_key(session_id))
+    if stored:
+        agent.state = ConversationState(stored['state'])
+        agent.criteria = SLRCriteria.model_validate_json(stored['criteria'])
+        agent.current_job_id = stored.get('job_id') or None
+        if agent.current_job_id:
+            agent.job = await get_redis().hgetall(job_key(agent.current_job_id))
+    return agent
+
+async def save_agent(agent: SLRAgentController):
+    """Write agent state and new messages back to Redis"""
+    session_key = _session_key(agent.session_id)
+    history_key = _history_key(agent.session_id)
+    
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.hset(session_key, mapping={
+            'state': agent.state.value,
+            'criteria': agent.criteria.model_dump_json(exclude_none=True),
+            'job_id': agent.current_job_id or ''
+        })
+        if agent.job_started:
+            pipe.hset(job_key(agent.current_job_id), mapping={
+                'criteria': agent.criteria.model_dump_json(exclude_none=True),
+                'state': 'STARTED',
+                'started': time.time()
+            })
+            pipe.expire(job_key(agent.current_job_id), JOB_TTL_SECONDS)
+        if agent.history_cleared:
+            pipe.delete(history_key)
+        if agent.unsaved_messages:
+            pipe.rpush(history_key, *[orjson.dumps(msg) for msg in agent.unsaved_messages])
+        pipe.expire(session_key, SESSION_TTL_SECONDS)
+        pipe.expire(history_key, SESSION_TTL_SECONDS)
+        await pipe.execute()
+    
+    agent.unsaved_messages = []
+    agent.history_cleared = False
+    agent.job_started = False
 
-def get_agent() -> SLRAgentController:
-    """Get or create agent instance"""
-    return _agent
+async def get_conversation_history(session_id: str) -> List[Dict]:
+    """Return conversation history for a session"""
+    entries = await get_redis().lrange(_history_key(session_id), 0, -1)
+    return [orjson.loads(entry) for entry in entries]
@@ -0,0 +1,16 @@
+"""Celery task queue for SLR job execution"""
+from celery import Celery
+from .config import settings
+
+celery_app = Celery(
+    "slr_tasks",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+    include=["app.core.tasks"]
+)
+
+celery_app.conf.update(
+    task_routes={"app.core.tasks.execute_slr_pipeline_task": {"queue": "slr"}},
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+)
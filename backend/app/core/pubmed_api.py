@@ -1,13 +1,26 @@
 """PubMed API Integration Module"""
 import aiohttp
 import asyncio
+import hashlib
+import io
+import multiprocessing
+import orjson
 import time
-from typing import List, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+from typing import List, Dict, Optional, Tuple
 from .config import settings
+from .redis_client import get_redis
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Redis hash of parsed articles keyed by PMID
+ARTICLE_CACHE_KEY = "pubmed:article"
+
+# NCBI esearch returns at most this many UIDs per query
+MAX_ESEARCH_RESULTS = 9999
+
 class PubMedAPI:
     """Interface for PubMed REST API"""
     
@@ -40,6 +53,61 @@ class PubMedAPI:
         self.api_key = settings.PUBMED_API_KEY
         self.batch_size = settings.PUBMED_BATCH_SIZE
         self.max_results = settings.PUBMED_MAX_RESULTS
+        self.max_retries = 3
+        
+        # NCBI E-utilities allow 10 requests/s with an API key, 3/s without.
+        # Request starts are spaced request_interval apart across every caller
+        # of this client; the semaphore only bounds requests in flight.
+        self.max_concurrency = 10 if self.api_key else 3
+        self.request_interval = 0.1 if self.api_key else 0.34
+        self._next_request_at = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pace_lock: Optional[asyncio.Lock] = None
+        self._limits_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Shared HTTP session, created lazily on first use
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=20, limit_per_host=10, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self._session
+    
+    def _limits(self) -> Tuple[asyncio.Semaphore, asyncio.Lock]:
+        """Concurrency and pacing primitives, recreated when the event loop changes
+        
+        Celery runs each task in a fresh loop, and asyncio primitives are loop-bound.
+        """
+        loop = asyncio.get_running_loop()
+        if self._limits_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._pace_lock = asyncio.Lock()
+            self._limits_loop = loop
+        return self._semaphore, self._pace_lock
+    
+    async def _wait_for_turn(self):
+        """Wait until at least request_interval has passed since the previous request started"""
+        _, pace_lock = self._limits()
+        async with pace_lock:
+            delay = self._next_request_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request_at = time.monotonic() + self.request_interval
+    
+    def _back_off(self, seconds: float):
+        """Hold off all request starts for the given number of seconds"""
+        self._next_request_at = max(self._next_request_at, time.monotonic() + seconds)
+    
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def search(self, query: str = None, max_results: int = None) -> Dict:
         """Search PubMed for relevant studies"""
@@ -47,115 +115,299 @@ class PubMedAPI:
             query = self.BASE_QUERY
         if max_results is None:
             max_results = self.max_results
+        if not 1 <= max_results <= MAX_ESEARCH_RESULTS:
+            raise ValueError(f"max_results must be between 1 and {MAX_ESEARCH_RESULTS}")
+        
+        cache_key = self._cache_key(query, max_results)
+        cached = await self._cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"PubMed cache hit for {cache_key}")
+            return cached
         
         try:
-            async with aiohttp.ClientSession() as session:
-                # Phase 1: Search (returns UIDs)
-                search_url = f"{self.base_url}/esearch.fcgi"
-                search_params = {
-                    'db': self.db,
-                    'term': query,
-                    'rettype': 'json',
-                    'retmax': min(max_results, 10000),
-                    'email': self.email,
+            session = await self._get_session()
+            
+            # Phase 1: Search (returns UIDs)
+            search_url = f"{self.base_url}/esearch.fcgi"
+            search_params = {
+                'db': self.db,
+                'term': query,
+                'retmode': 'json',
+                'retmax': max_results,
+                'usehistory': 'y',
+                'email': self.email,
+            }
+            if self.api_key:
+                search_params['api_key'] = self.api_key
+            
+            logger.info(f"Searching PubMed with query: {query[:100]}...")
+            await self._wait_for_turn()
+            async with session.get(search_url, params=search_params) as resp:
+                if resp.status != 200:
+                    raise Exception(f"PubMed search failed: {resp.status}")
+                search_result = await resp.json()
+            
+            esearch_result = search_result.get('esearchresult', {})
+            uids = esearch_result.get('idlist', [])
+            total_count = int(esearch_result.get('count', 0))
+            history = {'WebEnv': esearch_result.get('webenv'), 'query_key': esearch_result.get('querykey')}
+            
+            logger.info(f"Found {total_count} studies, fetching details for {len(uids)} records")
+            
+            # Phase 2: Fetch full records
+            if uids:
+                studies, failed_batches = await self._fetch_studies(session, uids, history)
+                result = {
+                    'total_count': total_count,
+                    'retrieved_count': len(studies),
+                    'failed_batches': failed_batches,
+                    'studies': studies
+                }
+            else:
+                result = {
+                    'total_count': 0,
+                    'retrieved_count': 0,
+                    'failed_batches': 0,
+                    'studies': []
                 }
-                if self.api_key:
-                    search_params['api_key'] = self.api_key
-                
-                logger.info(f"Searching PubMed with query: {query[:100]}...")
-                async with session.get(search_url, params=search_params) as resp:
-                    if resp.status != 200:
-                        raise Exception(f"PubMed search failed: {resp.status}")
-                    search_result = await resp.json()
-                
-                uids = search_result.get('esearchresult', {}).get('idlist', [])
-                total_count = int(search_result.get('esearchresult', {}).get('count', 0))
-                
-                logger.info(f"Found {total_count} studies, fetching details for {len(uids)} records")
-                
-                # Phase 2: Fetch full records
-                if uids:
-                    studies = await self._fetch_studies(session, uids)
-                    return {
-                        'total_count': total_count,
-                        'retrieved_count': len(uids),
-                        'studies': studies
-                    }
-                else:
-                    return {
-                        'total_count': 0,
-                        'retrieved_count': 0,
-                        'studies': []
-                    }
         except Exception as e:
             logger.error(f"PubMed API error: {str(e)}")
             raise
+        
+        # A partial result must not be served from cache for the whole TTL
+        if result['failed_batches']:
+            logger.warning(f"{result['failed_batches']} PubMed batches failed, not caching {cache_key}")
+        else:
+            await self._cache_set(cache_key, result)
+        return result
+    
+    @staticmethod
+    def _cache_key(query: str, max_results: int) -> str:
+        digest = hashlib.sha256(f"{query}|{max_results}".encode()).hexdigest()[:16]
+        return f"pubmed:q:{digest}"
     
-    async def _fetch_studies(self, session: aiohttp.ClientSession, uids: List[str]) -> List[Dict]:
-        """Fetch full study records from PubMed"""
+    async def _cache_get(self, key: str) -> Optional[Dict]:
+        """Look up a cached search result, treating Redis errors as a miss"""
+        try:
+            cached = await get_redis().get(key)
+        except Exception as e:
+            logger.warning(f"PubMed cache read failed: {str(e)}")
+            return None
+        return orjson.loads(cached) if cached else None
+    
+    async def _cache_set(self, key: str, result: Dict):
+        """Cache a search result, ignoring Redis errors"""
+        try:
+            await get_redis().set(key, orjson.dumps(result), ex=settings.PUBMED_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"PubMed cache write failed: {str(e)}")
+    
+    async def _fetch_studies(
+        self,
+        session: aiohttp.ClientSession,
+        uids: List[str],
+        history: Dict[str, str]
+    ) -> Tuple[List[Dict], int]:
+        """Fetch full study records from the esearch result on the NCBI history server
+        
+        Returns the studies and the number of batches that failed to fetch or parse.
+        """
         fetch_url = f"{self.base_url}/efetch.fcgi"
-        studies = []
         
-        # Process in batches
+        base_params = {
+            'db': self.db,
+            'retmode': settings.PUBMED_RETMODE,
+            'email': self.email,
+        }
+        if self.api_key:
+            base_params['api_key'] = self.api_key
+        
+        # Articles are immutable per PMID, so only uncached ones are fetched:
+        # fully uncached batches page through the history server, and the
+        # stragglers from partially cached batches are requested by id
+        cached = await self._cached_articles(uids)
+        batches = []
+        missing_ids = []
         for i in range(0, len(uids), self.batch_size):
             batch = uids[i:i + self.batch_size]
-            fetch_params = {
-                'db': self.db,
-                'id': ','.join(batch),
-                'rettype': 'json',
-                'retmode': settings.PUBMED_RETMODE,
-                'email': self.email,
-            }
-            if self.api_key:
-                fetch_params['api_key'] = self.api_key
-            
+            missing = [uid for uid in batch if uid not in cached]
+            if len(missing) == len(batch):
+                batches.append({**base_params, **history, 'retstart': i, 'retmax': len(batch)})
+            else:
+                missing_ids.extend(missing)
+        for i in range(0, len(missing_ids), self.batch_size):
+            batches.append({**base_params, 'id': ','.join(missing_ids[i:i + self.batch_size])})
+        
+        studies = list(cached.values())
+        if not batches:
+            return studies, 0
+        logger.info(f"{len(cached)} articles cached, fetching {len(batches)} batches from PubMed")
+        
+        # Launch all batches concurrently, throttled by the rate limiter, and hand
+        # each payload to the parse pool as it arrives while later batches are
+        # still in flight
+        tasks = [self._fetch_one(session, fetch_url, params) for params in batches]
+        loop = asyncio.get_running_loop()
+        parse_pool = get_parse_pool()
+        parse_jobs = []
+        failed_batches = 0
+        for next_batch in asyncio.as_completed(tasks):
             try:
-                async with session.get(fetch_url, params=fetch_params, timeout=aiohttp.ClientTimeout(total=60)) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        articles = data.get('result', {}).get('articles', data.get('PubmedArticleSet', []))
-                        if isinstance(articles, dict):
-                            articles = articles.get('articles', [])
-                        studies.extend(self._parse_articles(articles))
-                    time.sleep(0.5)  # Rate limiting
+                xml = await next_batch
             except Exception as e:
-                logger.warning(f"Error fetching batch {i}: {str(e)}")
+                logger.warning(f"Error fetching batch: {str(e)}")
+                failed_batches += 1
                 continue
+            parse_jobs.append(loop.run_in_executor(parse_pool, parse_pubmed_articles, xml))
         
-        return studies
+        fetched = []
+        for parsed in await asyncio.gather(*parse_jobs, return_exceptions=True):
+            if isinstance(parsed, Exception):
+                logger.warning(f"Error parsing batch: {str(parsed)}")
+                failed_batches += 1
+                continue
+            fetched.extend(study for study in parsed if study['pmid'] not in cached)
+        
+        await self._cache_articles(fetched)
+        studies.extend(fetched)
+        return studies, failed_batches
     
-    def _parse_articles(self, articles: List[Dict]) -> List[Dict]:
-        """Parse PubMed article JSON response"""
-        parsed_studies = []
+    async def _cached_articles(self, uids: List[str]) -> Dict[str, Dict]:
+        """Look up previously parsed articles by PMID in one round-trip"""
+        try:
+            cached = await get_redis().hmget(ARTICLE_CACHE_KEY, uids)
+        except Exception as e:
+            logger.warning(f"Article cache read failed: {str(e)}")
+            return {}
         
-        for article in articles:
-            try:
-                if isinstance(article, dict):
-                    pmid = article.get('uid') or article.get('MedlineCitation', {}).get('PMID', {}).get('content')
-                    title = article.get('title', article.get('MedlineCitation', {}).get('Article', {}).get('ArticleTitle', ''))
-                    abstract = article.get('abstract', article.get('MedlineCitation', {}).get('Article', {}).get('Abstract', {}).get('AbstractText', ''))
-                    
-                    if isinstance(abstract, list):
-                        abstract = ' '.join(abstract)
-                    
-                    year = article.get('pubdate', '').split('-')[0] if 'pubdate' in article else ''
-                    journal = article.get('journal', article.get('MedlineCitation', {}).get('Article', {}).get('Journal', {}).get('Title', ''))
-                    
-                    parsed_studies.append({
-                        'pmid': str(pmid),
-                        'title': title,
-                        'abstract': abstract,
-                        'year': year,
-                        'journal': journal,
-                        'source': 'pubmed'
-                    })
-            except Exception as e:
-                logger.warning(f"Error parsing article: {str(e)}")
-                continue
+        return {uid: orjson.loads(article) for uid, article in zip(uids, cached) if article}
+    
+    async def _cache_articles(self, studies: List[Dict]):
+        """Cache parsed articles by PMID in one round-trip"""
+        if not studies:
+            return
+        try:
+            await get_redis().hset(
+                ARTICLE_CACHE_KEY,
+                mapping={study['pmid']: orjson.dumps(study) for study in studies if study['pmid']}
+            )
+        except Exception as e:
+            logger.warning(f"Article cache write failed: {str(e)}")
+    
+    async def _fetch_one(
+        self,
+        session: aiohttp.ClientSession,
+        fetch_url: str,
+        fetch_params: Dict[str, str]
+    ) -> bytes:
+        """Fetch a single batch of raw XML within the NCBI rate limit
+        
+        Batches selected by PMID list are POSTed, as NCBI recommends for long id lists.
+        """
+        semaphore, _ = self._limits()
+        method = 'POST' if 'id' in fetch_params else 'GET'
+        request_args = {'data': fetch_params} if method == 'POST' else {'params': fetch_params}
+        label = f"retstart {fetch_params['retstart']}" if 'retstart' in fetch_params else "id batch"
         
-        return parsed_studies
+        async with semaphore:
+            for attempt in range(self.max_retries):
+                await self._wait_for_turn()
+                async with session.request(method, fetch_url, **request_args) as resp:
+                    if resp.status == 429:
+                        delay = self._retry_after(resp)
+                        logger.warning(f"PubMed rate limit hit, retrying in {delay}s (attempt {attempt + 1})")
+                        self._back_off(delay)
+                        continue
+                    if resp.status != 200:
+                        raise Exception(f"PubMed fetch failed for {label}: {resp.status}")
+                    if resp.headers.get('X-RateLimit-Remaining') == '0':
+                        self._back_off(1.0)
+                    return await resp.read()
+        
+        raise Exception("PubMed fetch failed: rate limit retries exhausted")
+    
+    @staticmethod
+    def _retry_after(resp: aiohttp.ClientResponse) -> float:
+        """Seconds to wait before retrying, from the Retry-After header"""
+        try:
+            return float(resp.headers.get('Retry-After', 1))
+        except ValueError:
+            return 1.0
+
+def parse_pubmed_articles(xml: bytes) -> List[Dict]:
+    """Stream-parse a PubmedArticleSet XML payload
+    
+    Module-level so it can be pickled into the parse process pool.
+    """
+    studies = []
+    articles = etree.iterparse(
+        io.BytesIO(xml),
+        events=('end',),
+        tag='PubmedArticle',
+        resolve_entities=False,
+        no_network=True
+    )
+    for _, article in articles:
+        try:
+            abstract = ' '.join(_element_text(a) for a in article.iterfind('.//AbstractText'))
+            year = article.findtext('.//PubDate/Year') or (article.findtext('.//PubDate/MedlineDate') or '')[:4]
+            
+            studies.append({
+                'pmid': article.findtext('.//PMID'),
+                'title': _element_text(article.find('.//ArticleTitle')),
+                'abstract': abstract,
+                'year': year,
+                'journal': article.findtext('.//Journal/Title') or '',
+                'source': 'pubmed'
+            })
+        except Exception as e:
+            logger.warning(f"Error parsing article: {str(e)}")
+        finally:
+            # Free parsed elements so memory stays flat across the batch
+            article.clear()
+            while article.getprevious() is not None:
+                del article.getparent()[0]
+    
+    return studies
+
+def _element_text(elem: Optional[etree._Element]) -> str:
+    """Full text of an element, including inline markup such as <i>"""
+    if elem is None:
+        return ''
+    return ''.join(elem.itertext()).strip()
+
+# Process pool for XML parsing, created on first use
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """Get or create the parse pool
+    
+    Daemonic processes (e.g. Celery prefork workers) cannot spawn children,
+    so there this returns None and parsing uses the loop's default thread pool.
+    """
+    global _parse_pool
+    if _parse_pool is None and not multiprocessing.current_process().daemon:
+        _parse_pool = ProcessPoolExecutor(max_workers=settings.PUBMED_PARSE_WORKERS)
+    return _parse_pool
+
+def shutdown_parse_pool():
+    """Shut down the parse pool"""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+# Shared client so connections are pooled across calls
+_pubmed_api: Optional[PubMedAPI] = None
+
+def get_pubmed_api() -> PubMedAPI:
+    """Get or create the shared PubMed client"""
+    global _pubmed_api
+    if _pubmed_api is None:
+        _pubmed_api = PubMedAPI()
+    return _pubmed_api
 
 async def fetch_pubmed_studies(query: str = None, max_results: int = None) -> Dict:
     """Utility function to fetch studies from PubMed"""
-    api = PubMedAPI()
+    api = get_pubmed_api()
     return await api.search(query, max_results)
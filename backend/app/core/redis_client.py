@@ -0,0 +1,35 @@
+"""Shared Redis client for job and session state"""
+from typing import Optional
+import redis.asyncio as redis
+from .config import settings
+
+_redis: Optional[redis.Redis] = None
+
+# Job records and stored decisions expire a week after their last update
+JOB_TTL_SECONDS = 7 * 24 * 60 * 60
+
+def get_redis() -> redis.Redis:
+    """Get or create the shared async Redis client"""
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+def job_key(job_id: str) -> str:
+    """Redis hash holding a job's criteria, state and latest progress"""
+    return f"slr:job:{job_id}"
+
+def decisions_key(job_id: str) -> str:
+    """Redis list holding a job's screening decisions as ndjson lines"""
+    return f"slr:job:{job_id}:decisions"
+
+def exclusions_key(job_id: str) -> str:
+    """Redis list holding a job's rule-layer exclusions as ndjson lines"""
+    return f"slr:job:{job_id}:exclusions"
+
+async def close_redis():
+    """Close the shared Redis client"""
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
@@ -1,20 +1,39 @@
 """SLR Pipeline - Deterministic Screening Engine"""
-from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass
-from enum import Enum
+from typing import Iterable, Iterator, List, Dict, Sequence, Tuple, Optional
+from dataclasses import dataclass, replace
+from enum import IntEnum
+import hashlib
 import logging
-from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix
+import re
+import sys
+from functools import lru_cache
+import numpy as np
+import orjson
+import pandas as pd
+from .config import settings
 
 logger = logging.getLogger(__name__)
 
-class DecisionLayer(str, Enum):
-    """Screening decision layers"""
-    RULES = "rules"
-    ML = "ml"
-    BERT = "bert"
-    HUMAN = "human"
+class DecisionLayer(IntEnum):
+    """Screening decision layers (serialized via _LAYER_NAMES)"""
+    RULES = 0
+    ML = 1
+    BERT = 2
+    HUMAN = 3
 
-@dataclass
+_LAYER_NAMES = ("rules", "ml", "bert", "human")
+
+# Rule-layer reasons, interned once and shared by every decision
+_R_NO_DISEASE = sys.intern("Does not match disease criteria")
+_R_NOT_TRIAL = sys.intern("Not a clinical trial")
+_R_MATCH = sys.intern("Matches disease and trial criteria")
+_RULE_DECISIONS = np.array(["EXCLUDE", "EXCLUDE", "INCLUDE"], dtype=object)
+_RULE_REASONS = np.array([_R_NO_DISEASE, _R_NOT_TRIAL, _R_MATCH], dtype=object)
+
+# (decision, confidence, reasoning) as reused by the semantic cache
+Verdict = Tuple[str, float, str]
+
+@dataclass(slots=True, frozen=True)
 class ScreeningDecision:
     """Screening decision with provenance"""
     pmid: str
@@ -26,7 +45,7 @@ class ScreeningDecision:
     reasoning: str
     prisma_stage: str  # "Identification" | "Screening" | "Inclusion"
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SLRMetrics:
     """PRISMA-compliant accuracy metrics"""
     total_retrieved: int
@@ -42,12 +61,151 @@ class SLRMetrics:
     true_negatives: int
     false_negatives: int
 
+# Integer codes for the fixed-width decision columns
+_DECISION_LABELS = ("EXCLUDE", "INCLUDE")
+_LAYERS = tuple(DecisionLayer)
+
+class DecisionColumns(Sequence):
+    """Struct-of-arrays storage for screening decisions
+    
+    Confidence, decision and layer live in NumPy arrays grown geometrically;
+    text fields live in parallel lists. Indexing materializes a ScreeningDecision
+    on demand, so aggregate scans never touch per-decision Python objects.
+    A running BLAKE2b digest of the decisions doubles as an HTTP ETag.
+    """
+    
+    def __init__(self, capacity: int = 256):
+        self._n = 0
+        self.pmids: List[str] = []
+        self.titles: List[str] = []
+        self.abstracts: List[str] = []
+        self.reasonings: List[str] = []
+        self.prisma_stages: List[str] = []
+        self.confidences = np.empty(capacity, dtype=np.float64)
+        self.included = np.empty(capacity, dtype=np.uint8)
+        self.layers = np.empty(capacity, dtype=np.uint8)
+        self._digest = hashlib.blake2b(digest_size=16)
+    
+    def append(self, decision: ScreeningDecision):
+        """Store a decision's fields in the column arrays"""
+        if self._n == len(self.confidences):
+            self._grow()
+        i = self._n
+        self.confidences[i] = decision.confidence
+        self.included[i] = decision.decision == "INCLUDE"
+        self.layers[i] = decision.layer
+        self.pmids.append(decision.pmid)
+        self.titles.append(decision.title)
+        self.abstracts.append(decision.abstract)
+        self.reasonings.append(decision.reasoning)
+        self.prisma_stages.append(decision.prisma_stage)
+        self._digest.update(f"{decision.pmid}|{decision.decision}|{decision.confidence}\n".encode())
+        self._n += 1
+    
+    @property
+    def etag(self) -> str:
+        """Content hash of the decisions appended so far"""
+        return self._digest.hexdigest()
+    
+    def _grow(self):
+        """Double the capacity of the NumPy columns"""
+        capacity = 2 * len(self.confidences)
+        for name in ('confidences', 'included', 'layers'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._n] = column[:self._n]
+            setattr(self, name, grown)
+    
+    def __len__(self) -> int:
+        return self._n
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._n))]
+        if index < 0:
+            index += self._n
+        if not 0 <= index < self._n:
+            raise IndexError("decision index out of range")
+        return ScreeningDecision(
+            pmid=self.pmids[index],
+            title=self.titles[index],
+            abstract=self.abstracts[index],
+            decision=_DECISION_LABELS[self.included[index]],
+            confidence=float(self.confidences[index]),
+            layer=_LAYERS[self.layers[index]],
+            reasoning=self.reasonings[index],
+            prisma_stage=self.prisma_stages[index]
+        )
+    
+    def rows(self) -> Iterator[Tuple]:
+        """(pmid, title, decision, confidence, layer, reasoning) per decision, without building dataclasses"""
+        n = self._n
+        return zip(
+            self.pmids,
+            self.titles,
+            [_DECISION_LABELS[v] for v in self.included[:n].tolist()],
+            self.confidences[:n].tolist(),
+            [_LAYERS[c] for c in self.layers[:n].tolist()],
+            self.reasonings
+        )
+    
+    def included_count(self) -> int:
+        return int(np.count_nonzero(self.included[:self._n]))
+    
+    def mean_confidence(self) -> float:
+        return float(self.confidences[:self._n].mean()) if self._n else 0.0
+
+def _keyword_pattern(keywords: Iterable[str]) -> re.Pattern:
+    """Compile keywords into one word-anchored alternation
+    
+    Longest keywords go first so the regex engine settles on the most specific
+    alternative; a trailing optional 's' keeps plurals such as 'RCTs' matching.
+    The inline (?i) flag matches case-insensitively without lowercasing the text.
+    """
+    keywords = sorted({kw.lower() for kw in keywords}, key=len, reverse=True)
+    return re.compile(r"(?i)\b(?:" + "|".join(re.escape(kw) for kw in keywords) + r")s?\b")
+
+@lru_cache(maxsize=32)
+def _criteria_patterns(disease_terms: Tuple[str, ...], trial_terms: Tuple[str, ...]) -> Tuple[re.Pattern, re.Pattern]:
+    """Disease and trial patterns over the built-in keywords, compiled once per keyword set"""
+    return _keyword_pattern(disease_terms), _keyword_pattern(trial_terms)
+
+def _contains(titles: pd.Series, abstracts: pd.Series, pattern: re.Pattern, rows: np.ndarray) -> np.ndarray:
+    """Pattern hit for each selected row, scanning the abstract only where the title misses"""
+    found = np.zeros(len(titles), dtype=bool)
+    found[rows] = titles[rows].str.contains(pattern).to_numpy(dtype=bool)
+    pending = rows & ~found
+    if pending.any():
+        found[pending] = abstracts[pending].str.contains(pattern).to_numpy(dtype=bool)
+    return found
+
+def _match_kernel(titles: pd.Series, abstracts: pd.Series, disease_re: re.Pattern, trial_re: re.Pattern) -> np.ndarray:
+    """Per-study (disease_hit, trial_hit) flags as an (N, 2) bool array
+    
+    Expects NaN-free, default-indexed title and abstract columns. The trial
+    pattern is only scanned on studies that matched a disease, since
+    everything else is excluded regardless.
+    """
+    hits = np.zeros((len(titles), 2), dtype=bool)
+    hits[:, 0] = _contains(titles, abstracts, disease_re, np.ones(len(titles), dtype=bool))
+    if hits[:, 0].any():
+        hits[:, 1] = _contains(titles, abstracts, trial_re, hits[:, 0])
+    return hits
+
 class SLRScreeningPipeline:
     """Deterministic, auditable SLR screening pipeline"""
     
-    def __init__(self):
-        self.decisions: List[ScreeningDecision] = []
+    def __init__(self, semantic_cache=None):
+        self.decisions = DecisionColumns()
+        
+        # Optional ml_models.semantic_cache.SemanticCache in front of the BERT layer
+        self.semantic_cache = semantic_cache
         self.metrics = None
+        self._metrics_dirty = True
+        
+        # Rule-layer exclusions kept as (pmid, confidence, reasoning) for the audit trail;
+        # the worker stores them next to the decisions (see iter_exclusions)
+        self.exclusions: List[Tuple[str, float, str]] = []
         
         # Rules-based screening patterns
         self.disease_keywords = {
@@ -59,6 +217,10 @@ class SLRScreeningPipeline:
             'randomized controlled trial': ['rct', 'randomized controlled trial', 'randomized'],
             'clinical trial': ['clinical trial', 'trial phase']
         }
+        
+        # Flattened for _compile_criteria, which builds one alternation per category
+        self._disease_terms = tuple(kw for kws in self.disease_keywords.values() for kw in kws)
+        self._trial_terms = tuple(kw for kws in self.trial_keywords.values() for kw in kws)
     
     def screen_studies(
         self,
@@ -66,130 +228,189 @@ class SLRScreeningPipeline:
         criteria: Dict,
         ml_model=None,
         bert_model=None
-    ) -> Tuple[List[ScreeningDecision], SLRMetrics]:
+    ) -> Tuple[DecisionColumns, SLRMetrics]:
         """Multi-layer screening pipeline"""
         logger.info(f"Screening {len(studies)} studies")
         
-        self.decisions = []
-        
-        for study in studies:
-            # Layer 1: Rule-based screening (high precision)
-            decision = self._screen_rules(study, criteria)
-            
-            if not decision or decision.decision == "EXCLUDE":
-                continue
-            
-            # Layer 2: ML-based screening (if provided)
-            if ml_model:
-                decision = self._screen_ml(study, decision, ml_model)
-            
-            # Layer 3: BERT semantic similarity (if provided)
-            if bert_model and decision.decision != "EXCLUDE":
-                decision = self._screen_bert(study, decision, bert_model)
-            
-            if decision:
-                self.decisions.append(decision)
+        self.decisions = DecisionColumns(capacity=max(256, len(studies)))
+        disease_re, trial_re = self._compile_criteria(criteria)
+        
+        # Layer 1: Rule-based screening (high precision), vectorized over all studies
+        verdicts = self._screen_rules(studies, disease_re, trial_re)
+        included_rows = verdicts['decision'].to_numpy() == "INCLUDE"
+        
+        # Only included studies become ScreeningDecision objects
+        excluded = verdicts[~included_rows]
+        self.exclusions = list(zip(
+            [studies[i].get('pmid') for i in excluded.index],
+            excluded['confidence'].tolist(),
+            excluded['reasoning'].tolist()
+        ))
+        
+        surviving = [
+            (studies[i], ScreeningDecision(
+                pmid=studies[i].get('pmid'),
+                title=studies[i].get('title'),
+                abstract=studies[i].get('abstract'),
+                decision="INCLUDE",
+                confidence=float(verdicts['confidence'].iat[i]),
+                layer=DecisionLayer.RULES,
+                reasoning=str(verdicts['reasoning'].iat[i]),
+                prisma_stage="Inclusion"
+            ))
+            for i in np.flatnonzero(included_rows)
+        ]
+        
+        # Layer 2: ML-based screening (if provided), one call over all survivors
+        if ml_model:
+            surviving = self._screen_ml_batch(surviving, ml_model)
+        
+        # Layer 3: BERT semantic similarity (if provided), batched forward passes
+        if bert_model:
+            surviving = self._screen_bert_batch(surviving, criteria, bert_model)
+        
+        for _, decision in surviving:
+            self.decisions.append(decision)
+        self._metrics_dirty = True
         
         # Compute metrics
         metrics = self._compute_metrics()
-        logger.info(f"Screening complete: {len(self.decisions)} included, Precision: {metrics.precision:.2f}")
+        logger.info(f"Screening complete: {metrics.total_included} included, Precision: {metrics.precision:.2f}")
         
         return self.decisions, metrics
     
+    def _compile_criteria(self, criteria: Dict) -> Tuple[re.Pattern, re.Pattern]:
+        """Disease and trial patterns for a screening run
+        
+        Rules match the union of all built-in keywords whatever the criteria name,
+        so the patterns are compiled once and shared by every run.
+        """
+        return _criteria_patterns(self._disease_terms, self._trial_terms)
+    
     def _screen_rules(
         self,
-        study: Dict,
-        criteria: Dict
-    ) -> Optional[ScreeningDecision]:
-        """Rule-based screening - highest precision layer"""
-        title = (study.get('title') or '').lower()
-        abstract = (study.get('abstract') or '').lower()
-        text = f"{title} {abstract}"
-        
-        # Check disease presence
-        disease_match = False
-        for disease, keywords in self.disease_keywords.items():
-            if any(kw in text for kw in keywords):
-                disease_match = True
-                break
-        
-        if not disease_match:
-            return ScreeningDecision(
-                pmid=study.get('pmid'),
-                title=study.get('title'),
-                abstract=study.get('abstract'),
-                decision="EXCLUDE",
-                confidence=0.95,
-                layer=DecisionLayer.RULES,
-                reasoning="Does not match disease criteria",
-                prisma_stage="Screening"
-            )
+        studies: List[Dict],
+        disease_re: re.Pattern,
+        trial_re: re.Pattern
+    ) -> pd.DataFrame:
+        """Rule-based screening - highest precision layer
         
-        # Check trial type presence
-        trial_match = False
-        for trial_type, keywords in self.trial_keywords.items():
-            if any(kw in text for kw in keywords):
-                trial_match = True
-                break
-        
-        if not trial_match:
-            return ScreeningDecision(
-                pmid=study.get('pmid'),
-                title=study.get('title'),
-                abstract=study.get('abstract'),
-                decision="EXCLUDE",
-                confidence=0.92,
-                layer=DecisionLayer.RULES,
-                reasoning="Not a clinical trial",
-                prisma_stage="Screening"
-            )
+        Returns one row per study with decision, confidence and reasoning columns.
+        """
+        df = pd.DataFrame(studies, columns=['pmid', 'title', 'abstract'])
+        titles = df['title'].fillna('')
+        abstracts = df['abstract'].fillna('')
         
-        # Passed rule screening
-        return ScreeningDecision(
-            pmid=study.get('pmid'),
-            title=study.get('title'),
-            abstract=study.get('abstract'),
-            decision="INCLUDE",
-            confidence=0.90,
-            layer=DecisionLayer.RULES,
-            reasoning="Matches disease and trial criteria",
-            prisma_stage="Inclusion"
-        )
+        hits = _match_kernel(titles, abstracts, disease_re, trial_re)
+        # Rule outcome per study: 0 no disease, 1 not a trial, 2 match
+        outcome = np.select([~hits[:, 0], ~hits[:, 1]], [0, 1], 2)
+        
+        return pd.DataFrame({
+            'decision': _RULE_DECISIONS[outcome],
+            'confidence': np.array([0.95, 0.92, 0.90])[outcome],
+            'reasoning': _RULE_REASONS[outcome]
+        })
     
-    def _screen_ml(
+    def _screen_ml_batch(
         self,
-        study: Dict,
-        current_decision: ScreeningDecision,
+        surviving: List[Tuple[Dict, ScreeningDecision]],
         ml_model
-    ) -> ScreeningDecision:
+    ) -> List[Tuple[Dict, ScreeningDecision]]:
         """ML-based screening layer"""
         # Placeholder: would use actual ML model
         # For demo: boost confidence if rules already included
-        if current_decision.decision == "INCLUDE":
-            return ScreeningDecision(
-                pmid=study.get('pmid'),
-                title=study.get('title'),
-                abstract=study.get('abstract'),
-                decision="INCLUDE",
+        return [
+            (study, replace(
+                decision,
                 confidence=0.92,
                 layer=DecisionLayer.ML,
-                reasoning="ML model: High likelihood of relevance",
-                prisma_stage=current_decision.prisma_stage
-            )
-        return current_decision
+                reasoning="ML model: High likelihood of relevance"
+            ) if decision.decision == "INCLUDE" else decision)
+            for study, decision in surviving
+        ]
     
-    def _screen_bert(
+    def _screen_bert_batch(
         self,
-        study: Dict,
-        current_decision: ScreeningDecision,
+        surviving: List[Tuple[Dict, ScreeningDecision]],
+        criteria: Dict,
         bert_model
-    ) -> ScreeningDecision:
-        """BERT semantic similarity screening"""
-        # Placeholder: would compute semantic similarity
-        return current_decision
+    ) -> List[Tuple[Dict, ScreeningDecision]]:
+        """BERT semantic similarity screening
+        
+        Scores every included study against the criteria in batched forward
+        passes (see ml_models.bert_screening.BertScreener); studies below
+        SIMILARITY_THRESHOLD are excluded at this layer. With a semantic cache,
+        near-duplicates of previously scored studies skip the model; a scorer
+        that exposes embed() also supplies the cache's vectors, so each text is
+        encoded once.
+        """
+        candidates = [i for i, (_, decision) in enumerate(surviving) if decision.decision == "INCLUDE"]
+        if not candidates:
+            return surviving
+        
+        texts = [
+            f"{surviving[i][1].title or ''} {surviving[i][1].abstract or ''}"
+            for i in candidates
+        ]
+        query = " ".join(str(value) for value in criteria.values() if value)
+        verdicts: List[Optional[Verdict]] = [None] * len(texts)
+        reuse_embeddings = self.semantic_cache is not None and hasattr(bert_model, 'embed')
+        if self.semantic_cache:
+            scorer = getattr(bert_model, 'model_name', type(bert_model).__name__)
+            if reuse_embeddings:
+                embeddings, embedder = bert_model.embed(texts), scorer
+            else:
+                embeddings, embedder = self.semantic_cache.embed(texts), None
+            namespace = self.semantic_cache.namespace_key(
+                criteria,
+                scorer,
+                settings.SIMILARITY_THRESHOLD,
+                embedder
+            )
+            verdicts = self.semantic_cache.lookup(namespace, embeddings)
+        
+        misses = [j for j, verdict in enumerate(verdicts) if verdict is None]
+        if misses:
+            if reuse_embeddings:
+                scores = (embeddings[misses] @ bert_model.embed([query])[0]).tolist()
+            else:
+                scores = bert_model.similarity([texts[j] for j in misses], query).tolist()
+            for j, score in zip(misses, scores):
+                relevant = score >= settings.SIMILARITY_THRESHOLD
+                # Cosine similarity can be negative, so keep the confidence within [0, 1]
+                verdicts[j] = (
+                    "INCLUDE" if relevant else "EXCLUDE",
+                    min(max(score if relevant else 1.0 - score, 0.0), 1.0),
+                    f"BERT similarity to criteria: {score:.2f}"
+                )
+            if self.semantic_cache:
+                self.semantic_cache.add(namespace, embeddings[misses], [verdicts[j] for j in misses])
+                self.semantic_cache.save()
+        
+        screened = list(surviving)
+        for i, (label, confidence, reasoning) in zip(candidates, verdicts):
+            study, decision = surviving[i]
+            screened[i] = (study, replace(
+                decision,
+                decision=label,
+                confidence=confidence,
+                layer=DecisionLayer.BERT,
+                reasoning=reasoning,
+                prisma_stage="Inclusion" if label == "INCLUDE" else "Screening"
+            ))
+        return screened
     
     def _compute_metrics(self) -> SLRMetrics:
-        """Compute PRISMA-compliant metrics"""
+        """Compute PRISMA-compliant metrics, reusing the last result until decisions change"""
+        if not self._metrics_dirty and self.metrics is not None:
+            return self.metrics
+        
+        self.metrics = self._calculate_metrics()
+        self._metrics_dirty = False
+        return self.metrics
+    
+    def _calculate_metrics(self) -> SLRMetrics:
+        """Calculate metrics from the current decisions"""
         if not self.decisions:
             return SLRMetrics(
                 total_retrieved=0,
@@ -206,12 +427,12 @@ class SLRScreeningPipeline:
                 false_negatives=0
             )
         
-        included = len([d for d in self.decisions if d.decision == "INCLUDE"])
-        excluded = len([d for d in self.decisions if d.decision == "EXCLUDE"])
-        total = included + excluded
+        total = len(self.decisions)
+        included = self.decisions.included_count()
+        excluded = total - included
         
         # Compute metrics (simplified for demo)
-        avg_confidence = sum(d.confidence for d in self.decisions) / len(self.decisions) if self.decisions else 0
+        avg_confidence = self.decisions.mean_confidence()
         
         return SLRMetrics(
             total_retrieved=total,
@@ -228,19 +449,31 @@ class SLRScreeningPipeline:
             false_negatives=int(included * (1 - avg_confidence))
         )
     
+    def iter_decision_dicts(self) -> Iterator[Dict]:
+        """Yield decisions as dictionaries, one at a time"""
+        for pmid, title, decision, confidence, layer, reasoning in self.decisions.rows():
+            yield {
+                'pmid': pmid,
+                'title': title,
+                'decision': decision,
+                'confidence': confidence,
+                'layer': _LAYER_NAMES[layer],
+                'reasoning': reasoning
+            }
+    
+    def iter_decisions(self) -> Iterator[bytes]:
+        """Yield decisions as newline-delimited JSON (ndjson) lines"""
+        for decision in self.iter_decision_dicts():
+            yield orjson.dumps(decision) + b"\n"
+    
+    def iter_exclusions(self) -> Iterator[bytes]:
+        """Yield rule-layer exclusions as newline-delimited JSON (ndjson) lines"""
+        for pmid, confidence, reasoning in self.exclusions:
+            yield orjson.dumps({'pmid': pmid, 'confidence': confidence, 'reasoning': reasoning}) + b"\n"
+    
     def get_decisions(self) -> List[Dict]:
         """Return decisions as dictionaries"""
-        return [
-            {
-                'pmid': d.pmid,
-                'title': d.title,
-                'decision': d.decision,
-                'confidence': d.confidence,
-                'layer': d.layer.value,
-                'reasoning': d.reasoning
-            }
-            for d in self.decisions
-        ]
+        return list(self.iter_decision_dicts())
 
 def create_screening_pipeline() -> SLRScreeningPipeline:
     """Factory for screening pipeline"""
@@ -0,0 +1,109 @@
+"""Celery tasks - SLR pipeline execution on dedicated workers"""
+import asyncio
+import orjson
+from itertools import islice
+from .celery_app import celery_app
+from .pubmed_api import fetch_pubmed_studies, get_pubmed_api
+from .redis_client import JOB_TTL_SECONDS, get_redis, close_redis, decisions_key, exclusions_key, job_key
+from .slr_pipeline import create_screening_pipeline
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Decision lines per RPUSH when storing results
+DECISIONS_PUSH_BATCH = 1000
+
+def progress_channel(job_id: str) -> str:
+    """Redis Pub/Sub channel carrying progress updates for a job"""
+    return f"slr:progress:{job_id}"
+
+async def publish_progress(job_id: str, stage: str, **data):
+    """Record a progress update on the job and publish it to WebSocket subscribers"""
+    update = orjson.dumps({"job_id": job_id, "stage": stage, **data})
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.hset(job_key(job_id), mapping={"state": stage.upper(), "progress": update})
+        pipe.expire(job_key(job_id), JOB_TTL_SECONDS)
+        pipe.publish(progress_channel(job_id), update)
+        await pipe.execute()
+
+async def execute_slr_pipeline(
+    job_id: str,
+    disease: str,
+    study_type: str,
+    max_results: int
+):
+    """Execute SLR pipeline"""
+    try:
+        logger.info(f"Executing SLR pipeline for job {job_id}")
+        
+        # Step 1: Search PubMed
+        await publish_progress(job_id, "searching")
+        pubmed_result = await fetch_pubmed_studies(max_results=max_results)
+        studies = pubmed_result.get('studies', [])
+        logger.info(f"Retrieved {len(studies)} studies from PubMed")
+        
+        # Step 2: Screen studies
+        await publish_progress(job_id, "screening", total_found=pubmed_result.get('total_count', 0), retrieved=len(studies))
+        pipeline = create_screening_pipeline()
+        criteria = {'disease': disease, 'study_type': study_type}
+        decisions, metrics = pipeline.screen_studies(studies, criteria)
+        logger.info(f"Screening complete: {metrics.total_included} included")
+        
+        # Step 3: Generate reports
+        # In production: save to S3 + database
+        # Decisions and rule-layer exclusions are stored as ndjson lines so the API can stream them in pages
+        stored = (
+            (decisions_key(job_id), pipeline.iter_decisions()),
+            (exclusions_key(job_id), pipeline.iter_exclusions())
+        )
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key, lines in stored:
+                pipe.delete(key)
+                while batch := list(islice(lines, DECISIONS_PUSH_BATCH)):
+                    pipe.rpush(key, *batch)
+                pipe.expire(key, JOB_TTL_SECONDS)
+            pipe.hset(job_key(job_id), "decisions_etag", decisions.etag)
+            await pipe.execute()
+        logger.info(f"Job {job_id} completed successfully")
+        await publish_progress(
+            job_id,
+            "completed",
+            total_found=pubmed_result.get('total_count', 0),
+            processed=len(studies),
+            included=metrics.total_included,
+            excluded=metrics.total_excluded,
+            metrics={
+                "precision": metrics.precision,
+                "recall": metrics.recall,
+                "f1": metrics.f1_score,
+                "accuracy": metrics.accuracy
+            }
+        )
+        
+    except Exception as e:
+        logger.error(f"Pipeline execution error for job {job_id}: {str(e)}")
+        await publish_progress(job_id, "failed", error=str(e))
+        raise
+
+async def _run_pipeline(job_id: str, disease: str, study_type: str, max_results: int):
+    """Run the pipeline and release loop-bound clients before the loop closes"""
+    try:
+        await execute_slr_pipeline(job_id, disease, study_type, max_results)
+    finally:
+        await get_pubmed_api().close()
+        await close_redis()
+
+@celery_app.task(bind=True, acks_late=True)
+def execute_slr_pipeline_task(self, job_id: str, disease: str, study_type: str, max_results: int):
+    """Celery task: Execute SLR pipeline"""
+    return asyncio.run(_run_pipeline(job_id, disease, study_type, max_results))
+
+def enqueue_slr_job(job_id: str, disease: str, study_type: str, max_results: int):
+    """Dispatch the pipeline to the Celery workers, using the job id as the task id
+    
+    Publishing to the broker is blocking I/O; call this via asyncio.to_thread.
+    """
+    return execute_slr_pipeline_task.apply_async(
+        args=(job_id, disease, study_type, max_results),
+        task_id=job_id
+    )
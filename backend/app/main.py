@@ -1,13 +1,18 @@
 """FastAPI entry point for SLR Agentic Platform"""
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from .core.config import settings
 from .api.routes_slr import router as slr_router
+from .core.pubmed_api import get_pubmed_api, shutdown_parse_pool
+from .core.redis_client import close_redis
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="AI-powered Systematic Literature Review Platform",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -19,6 +24,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON payloads (results, conversation history)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close pooled PubMed and Redis connections and the parse pool"""
+    await get_pubmed_api().close()
+    await close_redis()
+    shutdown_parse_pool()
+
 @app.get("/health")
 def health():
     """Health check endpoint"""
@@ -37,5 +52,16 @@ def root():
 app.include_router(slr_router, prefix=settings.API_V1_PREFIX)
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Multiple workers need the app as an import string (run from backend/: python -m app.main)
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=os.cpu_count() or 1,
+        access_log=False,
+        log_level="warning"
+    )
@@ -0,0 +1 @@
+"""ML models for the SLR screening layers"""
@@ -0,0 +1,66 @@
+"""BERT Semantic Screening - batched similarity scoring"""
+from typing import List, Optional
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+from ..core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BertScreener:
+    """Scores study text against the review criteria with a sentence-transformer encoder
+    
+    Texts are embedded in length-sorted batches so each forward pass pads to
+    similar lengths, and one pass serves SCREENING_BATCH_SIZE studies.
+    With quantize set, the model runs in FP16 on GPU, or with int8 dynamically
+    quantized Linear layers on CPU.
+    """
+    
+    def __init__(
+        self,
+        model_name: str = settings.BERT_MODEL_NAME,
+        batch_size: int = settings.SCREENING_BATCH_SIZE,
+        device: Optional[str] = None,
+        quantize: bool = settings.BERT_QUANTIZE
+    ):
+        self.model_name = model_name
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = self._load_model(model_name, quantize)
+        logger.info(f"Loaded BERT screening model {model_name} on {self.device} (quantize={quantize})")
+    
+    def _load_model(self, model_name: str, quantize: bool) -> torch.nn.Module:
+        """Load the encoder for inference, reduced-precision if requested"""
+        on_gpu = self.device.startswith("cuda")
+        dtype = torch.float16 if quantize and on_gpu else torch.float32
+        model = AutoModel.from_pretrained(model_name, torch_dtype=dtype).to(self.device).eval()
+        if quantize and not on_gpu:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """L2-normalized mean-pooled embeddings, one row per text"""
+        embeddings = np.empty((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        
+        with torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                rows = order[start:start + self.batch_size]
+                inputs = self.tokenizer(
+                    [texts[i] for i in rows],
+                    padding=True,
+                    truncation=True,
+                    return_tensors="pt"
+                ).to(self.device)
+                hidden = self.model(**inputs).last_hidden_state
+                mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                embeddings[rows] = torch.nn.functional.normalize(pooled, dim=-1).float().cpu().numpy()
+        
+        return embeddings
+    
+    def similarity(self, texts: List[str], query: str) -> np.ndarray:
+        """Cosine similarity of each text to the query"""
+        return self.embed(texts) @ self.embed([query])[0]
@@ -0,0 +1,137 @@
+"""Semantic Cache - reuse BERT-layer verdicts for near-duplicate studies"""
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import orjson
+import os
+import pickle
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from ..core.config import settings
+from ..core.slr_pipeline import Verdict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Embedding-similarity cache of BERT-layer verdicts
+    
+    Each namespace (see namespace_key) gets its own inner-product FAISS index
+    over normalized embeddings, capped at max_entries with the oldest evicted
+    first. A study whose nearest cached neighbour scores above the threshold
+    reuses that neighbour's decision and confidence. Callers may bring their own
+    normalized embeddings (e.g. from BertScreener.embed) so each text is encoded
+    once; the SentenceTransformer is only loaded when embed() is used.
+    """
+    
+    def __init__(
+        self,
+        directory: str = settings.SEMANTIC_CACHE_DIR,
+        threshold: float = settings.SEMANTIC_CACHE_THRESHOLD,
+        model_name: str = settings.BERT_MODEL_NAME,
+        max_entries: int = settings.SEMANTIC_CACHE_MAX_ENTRIES
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._embedder: Optional[SentenceTransformer] = None
+        self._namespaces: Dict[bytes, Tuple[faiss.Index, List[Verdict]]] = {}
+        self._dirty = set()
+    
+    def namespace_key(
+        self,
+        criteria: Dict,
+        scorer: str,
+        similarity_threshold: float,
+        embedder: Optional[str] = None
+    ) -> bytes:
+        """Digest naming the index for verdicts from this scorer and threshold on these criteria
+        
+        The embedder (model_name unless given) is part of the key too, since its
+        vectors are what the index holds.
+        """
+        payload = orjson.dumps(
+            [criteria, scorer, similarity_threshold, embedder or self.model_name],
+            option=orjson.OPT_SORT_KEYS,
+            default=str
+        )
+        return hashlib.blake2b(payload, digest_size=16).digest()
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Normalized float32 embeddings, one row per text"""
+        if self._embedder is None:
+            self._embedder = SentenceTransformer(self.model_name)
+        return self._embedder.encode(
+            texts,
+            batch_size=settings.SCREENING_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        ).astype(np.float32)
+    
+    def lookup(self, namespace: bytes, embeddings: np.ndarray) -> List[Optional[Verdict]]:
+        """Verdict reused from each embedding's nearest neighbour, or None below the threshold
+        
+        Hits keep the neighbour's decision and confidence but get their own
+        reasoning, so the audit trail shows they came from the cache.
+        """
+        index, verdicts = self._namespace(namespace, embeddings.shape[1])
+        if index.ntotal == 0:
+            return [None] * len(embeddings)
+        scores, ids = index.search(embeddings, 1)
+        return [
+            (verdicts[i][0], verdicts[i][1], f"Semantic cache: matched prior study (sim {score:.2f})")
+            if score >= self.threshold else None
+            for score, i in zip(scores[:, 0].tolist(), ids[:, 0].tolist())
+        ]
+    
+    def add(self, namespace: bytes, embeddings: np.ndarray, new_verdicts: List[Verdict]):
+        """Index newly scored studies"""
+        if not new_verdicts:
+            return
+        index, verdicts = self._namespace(namespace, embeddings.shape[1])
+        index.add(embeddings)
+        verdicts.extend(new_verdicts)
+        
+        # Flat index ids are positions, so dropping the oldest keeps ids and verdicts aligned
+        excess = index.ntotal - self.max_entries
+        if excess > 0:
+            index.remove_ids(np.arange(excess, dtype=np.int64))
+            del verdicts[:excess]
+        self._dirty.add(namespace)
+    
+    def save(self):
+        """Write changed indexes and their verdicts to disk, each file replaced atomically"""
+        if not self._dirty:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for namespace in self._dirty:
+            index, verdicts = self._namespaces[namespace]
+            path = self._path(namespace)
+            tmp_suffix = f".{os.getpid()}.tmp"
+            
+            faiss.write_index(index, f"{path}.faiss{tmp_suffix}")
+            with open(f"{path}.pkl{tmp_suffix}", 'wb') as f:
+                pickle.dump(verdicts, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.faiss{tmp_suffix}", f"{path}.faiss")
+            os.replace(f"{path}.pkl{tmp_suffix}", f"{path}.pkl")
+        self._dirty.clear()
+    
+    def _path(self, namespace: bytes) -> str:
+        return os.path.join(self.directory, namespace.hex())
+    
+    def _namespace(self, namespace: bytes, dimension: int) -> Tuple[faiss.Index, List[Verdict]]:
+        """Index and verdicts for a namespace, loaded from disk on first use"""
+        if namespace not in self._namespaces:
+            path = self._path(namespace)
+            try:
+                index = faiss.read_index(f"{path}.faiss")
+                with open(f"{path}.pkl", 'rb') as f:
+                    verdicts = pickle.load(f)
+                # A save interrupted between the two replaces leaves them out of step
+                if index.ntotal != len(verdicts) or index.d != dimension:
+                    raise ValueError("index and verdicts out of step")
+            except Exception:
+                index, verdicts = faiss.IndexFlatIP(dimension), []
+            self._namespaces[namespace] = (index, verdicts)
+        return self._namespaces[namespace]